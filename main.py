@@ -1,11 +1,17 @@
-from collections import UserDict
-from typing import Tuple, Callable, List, Any
-from re import match
-from datetime import datetime
+from typing import Tuple, Callable, List, Any, Iterator, TextIO
+import re
+from datetime import datetime, date
+from itertools import islice
+from calendar import isleap
 import json
 import os
+import sys
 
 DATE_FORMAT = "%d.%m.%Y"
+STOP_WORDS = frozenset(("goodbye", "close", "exit"))
+NAME_RE = re.compile(r"[A-Za-z]+\Z")
+_today = date.today
+_MISSING = object()
 
 
 class CliApp:
@@ -25,12 +31,13 @@ class CliApp:
         """
 
         bot = AssistantBot()
-        bot.restore_data()
+        for warning in bot.restore_data():
+            print(warning)
 
         try:
-            while True:
-                command, args = self.parse_command(input())
-                if command in ["goodbye", "close", "exit"]:
+            for user_input in self.read_input():
+                command, args = self.parse_command(user_input)
+                if command in STOP_WORDS:
                     bot.backup_data()
                     print("Goodbye!")
                     break
@@ -41,6 +48,22 @@ class CliApp:
         except Exception as err:
             print(err)
 
+    @staticmethod
+    def read_input() -> Iterator[str]:
+        """
+        Yields the lines the user inputs. When the input is not a terminal (e.g. a pipe or a file), reads the lines
+        straight from stdin to skip the prompt handling that input() does on every call.
+
+        :return: lines of the user input without trailing newlines
+        """
+
+        if sys.stdin.isatty():
+            while True:
+                yield input()
+        else:
+            for line in sys.stdin:
+                yield line.rstrip("\n")
+
     @staticmethod
     def parse_command(user_input: str) -> Tuple[str, list[str]]:
         """
@@ -50,11 +73,11 @@ class CliApp:
         :return: tuple(command, *args)
         """
 
-        if len(user_input) == 0:
+        parts = user_input.split(None, 1)
+        if not parts:
             raise ValueError()
-        user_input = user_input.split()
-        command = user_input[0].lower()
-        args = user_input[1:]
+        command = sys.intern(parts[0].lower())
+        args = parts[1].split() if len(parts) == 2 else []
         return command, args
 
 
@@ -63,16 +86,18 @@ class AssistantBot:
     Assists a user with managing their address book (adding, deleting, changing, displaying entries).
     """
 
+    # Maps a command to the number of arguments its method takes, None if the number varies.
+    COMMANDS = {
+        "hello": 0,
+        "add": None,
+        "delete": None,
+        "change": 3,
+        "show": 1,
+        "help": 0,
+        "search": 1
+    }
+
     def __init__(self):
-        self.commands = {
-            "hello": self.hello,
-            "add": self.add,
-            "delete": self.delete,
-            "change": self.change,
-            "show": self.show,
-            "help": self.help,
-            "search": self.search
-        }
         self.addressbook = AddressBook()
         self.backup_file = "address_book.json"
 
@@ -82,13 +107,15 @@ class AssistantBot:
         """
         return self.addressbook.save_contacts(self.backup_file)
 
-    def restore_data(self) -> None:
+    def restore_data(self) -> list[str]:
         """
         Calls and returns a function that restores contacts from the file. If the file is empty, it does nothing.
+
+        :return: messages about the entries of the file that couldn't be restored
         """
 
         if os.stat(self.backup_file).st_size == 0:
-            return
+            return []
         return self.addressbook.restore_contacts(self.backup_file)
 
     @staticmethod
@@ -103,7 +130,7 @@ class AssistantBot:
             except TypeError as err:
                 return f"Invalid input, some info is missing: {err}"
             except KeyError as err:
-                return f"Sorry, no such command: {err}"
+                return f"KeyError: {err}"
             except ValueError as err:
                 return f"ValueError: {err}"
             else:
@@ -121,11 +148,21 @@ class AssistantBot:
         :return: command to execute with the arguments
         """
 
-        handler = self.commands[command]
+        arity = self.COMMANDS.get(command, _MISSING)
+        if arity is _MISSING:
+            return f"Sorry, no such command: {command!r}"
+
+        handler = getattr(self, command)
+        if arity == len(args):
+            if arity == 0:
+                return handler()
+            if arity == 1:
+                return handler(args[0])
+            if arity == 3:
+                return handler(args[0], args[1], args[2])
         return handler(*args)
 
     @staticmethod
-    @input_error
     def help() -> str:
         """
         Displays the help message.
@@ -147,7 +184,6 @@ class AssistantBot:
                "Possible birthday format: dd.mm.yyyy.\n"
 
     @staticmethod
-    @input_error
     def hello() -> str:
         """
         Returns a greeting to the 'hello' command.
@@ -157,7 +193,6 @@ class AssistantBot:
 
         return "How can I help you?"
 
-    @input_error
     def add(self, *args) -> None:
         """
         Calls and returns a function that adds the given information about a person to the addressbook.
@@ -166,37 +201,40 @@ class AssistantBot:
         if len(args) == 3:
 
             name, phone, birthday = args
+            verify_phone(phone)
+            birthday_date = datetime.strptime(birthday, DATE_FORMAT).date()
             record = Record(name)
             record.add_phone(phone)
-            birthday_date = datetime.strptime(birthday, DATE_FORMAT).date()
             record.add_birthday(birthday_date)
             return self.addressbook.add_record(record)
 
         elif len(args) == 2:
 
-            if args[0] in self.addressbook:
-                record = self.addressbook.data[args[0]]
+            name, value = args
+            if is_valid_phone(value):
+                phone, birthday_date = value, None
             else:
-                record = Record(args[0])
+                try:
+                    phone, birthday_date = None, datetime.strptime(value, DATE_FORMAT).date()
+                except ValueError:
+                    raise ValueError(
+                        "The format of your entry isn't right. Type in 'help' to see possible formats.") from None
+
+            record = self.addressbook.find_record(name)
+            if record is None:
+                record = Record(name)
                 self.addressbook.add_record(record)
 
-            if Phone.is_valid(args[1]):
-                phone = args[1]
+            if phone:
                 return record.add_phone(phone)
-            elif match(r"\d{2}\.\d{2}\.\d{4}", args[1]):
-                birthday = args[1]
-                birthday_date = datetime.strptime(birthday, DATE_FORMAT).date()
-                return record.add_birthday(birthday_date)
-            else:
-                raise ValueError("The format of your entry isn't right. Type in 'help' to see possible formats.")
+            return record.add_birthday(birthday_date)
 
         elif len(args) == 1:
 
             record = Record(args[0])
             return self.addressbook.add_record(record)
 
-    @input_error
-    def change(self, name: str, old_phone: str, new_phone: str) -> None:
+    def change(self, name: str, old_phone: str, new_phone: str) -> str | None:
         """
         Calls and returns a function that replaces the phone number of the given person.
 
@@ -205,23 +243,24 @@ class AssistantBot:
         :param name: a name that has to be already present in the address book
         """
 
-        record = self.addressbook.data[name]
-        record.delete_phone(old_phone)
-        return record.add_phone(new_phone)
+        record = self.addressbook.find_record(name)
+        if record is None:
+            return "You don't have a contact with this name in your address book."
+        return record.change_phone(old_phone, new_phone)
 
-    @input_error
-    def show(self, name: str) -> str:
+    def show(self, name: str) -> str | None:
         """
-        Returns the record of the given person as a human-readable message.
+        Returns the record of the given person as a human-readable message. The whole address book is written straight
+        to stdout instead of being returned.
 
         :param name: name of a person, 'all' if the user wants all the address book to be printed, 'page' if the
         user wants to see the address book page by page
-        :return: information about a person, the whole address book, one page of the address book
+        :return: information about a person, one page of the address book
         """
 
         return self.addressbook.show_record(name)
 
-    def delete(self, name: str, phone: str | None = None) -> None:
+    def delete(self, name: str, phone: str | None = None) -> str | None:
         """
         Calls and returns a function that deletes the given phone number from the record of the given person or the
         whole record.
@@ -231,7 +270,9 @@ class AssistantBot:
         """
 
         if phone:
-            record = self.addressbook.data[name]
+            record = self.addressbook.find_record(name)
+            if record is None:
+                return "You don't have a contact with this name in your address book."
             return record.delete_phone(phone)
         else:
             return self.addressbook.delete_record(name)
@@ -248,15 +289,17 @@ class AssistantBot:
 
 class Field:
     """
-    The base class for the fields of the Record class.
+    The base class for the fields of the Record class. The value is verified once, when the field is created.
     """
 
+    __slots__ = ("value",)
+
     def __init__(self, value):
-        self._value = None
+        self.verify_value(value)
         self.value = value
 
     def __str__(self):
-        return f"{self.value}"
+        return str(self.value)
 
     def __hash__(self) -> int:
         return self.value.__hash__()
@@ -271,21 +314,17 @@ class Field:
     def verify_value(value):
         pass
 
-    @property
-    def value(self):
-        return self._value
-
-    @value.setter
-    def value(self, value):
-        self.verify_value(value)
-        self._value = value
-
 
 class Name(Field):
     """
     A name of a person in an address book.
     """
 
+    __slots__ = ()
+
+    def __str__(self):
+        return self.value
+
     def verify_value(self, value: str):
         """
         Verifies that name consists only of alphabetical characters. Raises exception if the name contains something
@@ -294,28 +333,55 @@ class Name(Field):
         :param value: a name to check
         """
 
-        if not match(r"\b[A-Za-z]+", value):
+        if NAME_RE.match(value) is None:
             raise ValueError("Name can contain only latin letters.")
 
 
+def is_valid_phone(value: str) -> bool:
+    """
+    Checks the phone format without the regex engine: either 12 digits with an optional leading '+', or 10 digits.
+
+    :param value: phone number
+    :return: True if the phone has one of the valid formats
+    """
+
+    if value.startswith("+"):
+        digits = value[1:]
+        return len(digits) == 12 and digits.isdecimal()
+    return len(value) in (10, 12) and value.isdecimal()
+
+
+def verify_phone(value: str) -> None:
+    """
+    Checks if the phone is given in a valid format. Raises exception if the phone doesn't match one of the formats.
+    Can be called before a Phone is created, so that no object is allocated for an invalid phone.
+
+    :param value: phone number
+    """
+
+    if not is_valid_phone(value):
+        raise ValueError("Invalid phone format. Try +123456789012 or 1234567890.")
+
+
 class Phone(Field):
     """
     A phone number of a person in an address book.
     """
 
-    @classmethod
-    def is_valid(cls, value: str):
-        return match(r"(\+?\d{12}|\d{10})", value)
+    __slots__ = ()
 
-    def verify_value(self, value: str):
+    def __str__(self):
+        return self.value
+
+    @staticmethod
+    def verify_value(value: str):
         """
         Checks if the phone is given in a valid format. Raises exception if the phone doesn't match one of the formats.
 
         :param value: phone number
         """
 
-        if not Phone.is_valid(value):
-            raise ValueError("Invalid phone format. Try +123456789012 or 1234567890.")
+        verify_phone(value)
 
 
 class Birthday(Field):
@@ -323,6 +389,8 @@ class Birthday(Field):
     Person's birthday date.
     """
 
+    __slots__ = ()
+
     def verify_value(self, value: datetime.date):
         """
         Checks if the birthdate is not in the future. Raises exception if the date is in the future.
@@ -330,7 +398,7 @@ class Birthday(Field):
         :param value: datetime object
         """
 
-        if value > datetime.now().date():
+        if value > _today():
             raise ValueError("Birthday can't be in future.")
 
 
@@ -344,18 +412,23 @@ class Record:
         if not name:
             raise ValueError("The record must have a name.")
         self.name = Name(name)
-        self.phones = []
+        self.phones = {}
         self.birthday = None
+        self._str_cache = None
+        self._dated_str_cache = None
 
     def add_phone(self, phone: str) -> None:
         """
-        Adds a phone to the record.
+        Adds a phone to the record. Raises exception if the phone is already in the record.
 
         :param phone: a phone number
         """
 
+        if phone in self.phones:
+            raise ValueError("This phone is already in the record.")
         phone_object = Phone(phone)
-        self.phones.append(phone_object)
+        self.phones[phone_object.value] = phone_object
+        self._str_cache = None
 
     def delete_phone(self, phone: str) -> None:
         """
@@ -364,12 +437,29 @@ class Record:
         :param phone: a phone number to delete
         """
 
-        phone = self.find_phone(phone)
-        if phone:
-            self.phones.remove(phone)
+        if phone in self.phones:
+            del self.phones[phone]
+            self._str_cache = None
         else:
             raise ValueError("The given phone is not in a list.")
 
+    def change_phone(self, old_phone: str, new_phone: str) -> None:
+        """
+        Replaces a phone in the record. Checks everything before changing the record, so a failed change keeps the old
+        phone. Raises exception if the new phone is invalid or already in the record, or if the old phone isn't in it.
+
+        :param old_phone: a phone number to replace
+        :param new_phone: a new phone number
+        """
+
+        verify_phone(new_phone)
+        if old_phone not in self.phones:
+            raise ValueError("The given phone is not in a list.")
+        if new_phone != old_phone and new_phone in self.phones:
+            raise ValueError("This phone is already in the record.")
+        self.delete_phone(old_phone)
+        self.add_phone(new_phone)
+
     def find_phone(self, phone: str) -> Phone:
         """
         Finds and returns a phone from the phone list.
@@ -378,29 +468,44 @@ class Record:
         :return: an entry in a phone list corresponding to this phone
         """
 
-        for phone_object in self.phones:
-            if phone_object.value == phone:
-                return phone_object
+        return self.phones.get(phone)
 
-    def count_days_to_birthday(self) -> str:
+    def count_days_to_birthday(self, today: date | None = None) -> str:
         """
         Counts the days left to the birthdate of the given person.
 
+        :param today: current date, taken from the clock if not given
         :return: a message that contains a number of days left or a reminder that a person has their birthday today
         """
 
-        today = datetime.now().date()
-        this_years_birthday = self.birthday.value.replace(year=today.year)
+        if today is None:
+            today = _today()
+        today_ordinal = today.toordinal()
+        birthday = self.birthday.value
+        month, day = birthday.month, birthday.day
+        birthday_ordinal = self.birthday_in_year(today.year, month, day).toordinal()
 
-        if today < this_years_birthday:
-            difference = this_years_birthday - today
-            return f"there are {difference.days} days to this person's birthday"
-        if today == this_years_birthday:
+        if today_ordinal == birthday_ordinal:
             return "Today is this person's birthday!"
-        else:
-            next_years_birthday = this_years_birthday.replace(year=this_years_birthday.year + 1)
-            difference = next_years_birthday - today
-            return f"there are {difference.days} days to this person's birthday"
+        if today_ordinal > birthday_ordinal:
+            birthday_ordinal = self.birthday_in_year(today.year + 1, month, day).toordinal()
+        return f"there are {birthday_ordinal - today_ordinal} days to this person's birthday"
+
+    @staticmethod
+    def birthday_in_year(year: int, month: int, day: int) -> date:
+        """
+        Returns the date of the birthday in the given year. A birthday on the 29th of February is celebrated on the 28th
+        in non-leap years.
+
+        :param year: year of the birthday
+        :param month: month of the birth
+        :param day: day of the birth
+        :return: date of the birthday
+        """
+
+        if month == 2 and day == 29 and not isleap(year):
+            day = 28
+        return date(year, month, day)
 
     def add_birthday(self, birthday: datetime.date):
         """
@@ -410,18 +515,44 @@ class Record:
         """
 
         self.birthday = Birthday(birthday)
+        self._str_cache = None
+
+    def format(self, today: date | None = None) -> str:
+        """
+        Returns the record as a human-readable message. Callers that format many records can pass the current date to
+        avoid reading the clock for every record.
+
+        :param today: current date, taken from the clock if not given
+        :return: name, phones and birthday of the person with the days left to the birthday
+        """
+
+        # The days left to the birthday change daily, so the full message is cached with the date it was made for.
+        result = self._str_cache
+        if result is None:
+            phones = ", ".join(map(str, self.phones.values()))
+            if self.birthday:
+                result = f"Name: {self.name}, phones: {phones}, birthday: {self.birthday}"
+            else:
+                result = f"Name: {self.name}, phones: {phones}"
+            self._str_cache = result
+            self._dated_str_cache = None
+        if not self.birthday:
+            return result
+
+        if today is None:
+            today = _today()
+        dated = self._dated_str_cache
+        if dated is None or dated[0] != today:
+            dated = self._dated_str_cache = (today, f"{result}, {self.count_days_to_birthday(today)}")
+        return dated[1]
 
     def __str__(self):
-        phones = ", ".join(map(lambda phone: str(phone), self.phones))
-        if self.birthday:
-            return f"Name: {self.name}, phones: {phones}, birthday: {self.birthday}, {self.count_days_to_birthday()}"
-        else:
-            return f"Name: {self.name}, phones: {phones}"
+        return self.format()
 
 
-class AddressBook(UserDict):
+class AddressBook(dict):
     """
-    An address book.
+    An address book. Records are keyed by the lowercased name, so names are looked up case-insensitively.
     """
 
     PAGE_SIZE = 2
@@ -437,27 +568,33 @@ class AddressBook(UserDict):
 
         :param record: a record to add
         """
-        if record.name not in self.data:
-            self.data[record.name] = record
-        else:
+        if self.setdefault(record.name.value.lower(), record) is not record:
             raise ValueError(
                 "This name is already in your phonebook. If you want to change the phone number, type 'change'."
                 "If you want to add a phone number, type it after the name.")
 
-    def show_record(self, name: str) -> str:
+    def find_record(self, name: str) -> Record | None:
+        """
+        Returns the record of the given person or None if this person is not in an address book.
+
+        :param name: name of a person in any case
+        :return: the record of the person
+        """
+
+        return self.get(name.lower())
+
+    def show_record(self, name: str, out: TextIO | None = None) -> str | None:
         """
-        Returns the info of a given person. If 'all' was given as an argument it returns the whole phonebook. If 'page'
-        was given as an argument is shows the next page.
+        Returns the info of a given person. If 'all' was given as an argument it writes the whole phonebook to the
+        output stream record by record and returns nothing. If 'page' was given as an argument is shows the next page.
 
         :param name: name to show, 'all' or 'page'
-        :return: a phone number, an addressbook, a page
+        :param out: a text stream to write the whole phonebook to, stdout if not given
+        :return: a phone number, a page
         """
         if name == "all":
-            if self.data:
-                result = ""
-                for value in self.data.values():
-                    result += str(value) + "\n"
-                return result
+            if self:
+                self.dump(out if out is not None else sys.stdout)
             else:
                 return "You do not have any contacts yet."
         elif name == "page":
@@ -466,13 +603,25 @@ class AddressBook(UserDict):
                 self._paginator = None
                 return "You reached the end of the address book. Call this command again."
             else:
-                return "\n".join([str(r) for r in page_content])
+                today = _today()
+                return "\n".join([r.format(today) for r in page_content])
         else:
-            if name in self.data:
-                return str(self.data[name])
+            record = self.find_record(name)
+            if record is not None:
+                return str(record)
             else:
                 return "You don't have a contact with this name in your address book."
 
+    def dump(self, out: TextIO) -> None:
+        """
+        Writes every record of the address book to the given stream, one per line.
+
+        :param out: a text stream to write to
+        """
+
+        today = _today()
+        out.writelines(f"{record.format(today)}\n" for record in self.values())
+
     def delete_record(self, name: str) -> None:
         """
         Deletes the record of a person from an address book. Raises exception if this person is not in an address book.
@@ -480,35 +629,27 @@ class AddressBook(UserDict):
         :param name: name of a person to delete
         """
 
-        if name in self.data:
-            del self.data[name]
-        else:
-            raise KeyError("This person is not in your address book.")
+        try:
+            del self[name.lower()]
+        except KeyError:
+            raise KeyError("This person is not in your address book.") from None
 
     def paginator(self):
         if not self._paginator:
             self._paginator = self.iterator()
         return self._paginator
 
-    def iterator(self) -> list:
+    def iterator(self) -> Iterator[list[Record]]:
         """
-        Yields pages of two entries from the address book.
+        Yields pages of two entries from the address book. The records are copied once when paging starts, so the book
+        can be changed between pages.
 
         :return: one page of the address book
         """
 
-        page_start = 0
-        while True:
-            values = list(self.data.values())
-            if page_start >= len(values):
-                break
-            if page_start + AddressBook.PAGE_SIZE > len(values):
-                remaining = len(values) - page_start
-                page_end = page_start + remaining
-            else:
-                page_end = page_start + AddressBook.PAGE_SIZE
-            yield values[page_start:page_end]
-            page_start = page_end
+        records = iter(list(self.values()))
+        while page := list(islice(records, AddressBook.PAGE_SIZE)):
+            yield page
 
     def search(self, needle: str) -> str:
         """
@@ -517,7 +658,7 @@ class AddressBook(UserDict):
         :param needle: combination of digits or letters to search
         :return: corresponding contacts
         """
-        result = filter(lambda x: needle in str(x), self.data.values())
+        result = filter(lambda x: needle in str(x), self.values())
         if result:
             return "\n".join([str(r) for r in result])
         else:
@@ -530,45 +671,57 @@ class AddressBook(UserDict):
         :param backup_file: name of a backup file
         """
 
-        if len(self.data) == 0:
+        if len(self) == 0:
             raise "You have no contacts to save."
 
         data_to_save = []
-        for record in self.data.values():
+        for record in self.values():
             persons_record = \
-                {"name": record.name.value, "phones": [phone.value for phone in record.phones if len(record.phones) > 0],
+                {"name": record.name.value, "phones": list(record.phones),
                  "birthday": record.birthday.value.strftime(DATE_FORMAT) if record.birthday else None}
             data_to_save.append(persons_record)
 
         with open(backup_file, "w") as json_file:
             json.dump(data_to_save, json_file)
 
-    def restore_contacts(self, backup_file: str) -> None:
+    def restore_contacts(self, backup_file: str) -> list[str]:
         """
-        Restores the address book from the file. Throws an exception if the file cannot be decoded by JSON.
+        Restores the address book from the file. Repeated phones of a contact are restored once. Contacts whose names
+        differ only in case are merged: their phones are combined and the first birthday is kept. Contacts with names
+        and phones that are no longer valid are skipped. Throws an exception if the file cannot be decoded by JSON.
 
         :param backup_file: name of a backup file
+        :return: messages about the skipped entries
         """
 
+        warnings = []
         try:
             with open(backup_file, "r") as json_file:
                 unpacked_contacts = json.load(json_file)
 
             for contact in unpacked_contacts:
-                record = Record(contact["name"])
+                try:
+                    new_record = Record(contact["name"])
+                except ValueError as err:
+                    warnings.append(f"Skipped contact {contact['name']!r} from the backup: {err}")
+                    continue
+                # Older backups can hold names that differ only in case, such contacts are merged into the first one.
+                record = self.setdefault(contact["name"].lower(), new_record)
                 for phone in contact["phones"]:
-                    record.add_phone(phone)
-                if contact["birthday"]:
+                    if phone in record.phones:
+                        continue
+                    try:
+                        record.add_phone(phone)
+                    except ValueError as err:
+                        warnings.append(f"Skipped phone {phone!r} of {contact['name']!r} from the backup: {err}")
+                if contact["birthday"] and not record.birthday:
                     record.add_birthday(datetime.strptime(contact["birthday"], DATE_FORMAT).date())
-                self.data[record.name] = record
         except json.decoder.JSONDecodeError:
             raise ValueError("Cannot restore contacts from file")
+        return warnings
 
     def __str__(self):
-        result = ""
-        for record in self.data.values():
-            result += str(record)
-        return result
+        return "".join(str(record) for record in self.values())
 
 
 if __name__ == "__main__":